@@ -103,8 +103,9 @@ python main.py \\
   --confidence 0.3 \\
   --start-datetime "2026-01-26T07:00:00"
 
-# Step 3: Use the generated CSV for LSTM training
-# The file data/output/morning_analysis/traffic_timeseries.csv is ready!
+# Step 3: Use the generated dataset for LSTM training
+# The file data/output/morning_analysis/traffic_timeseries.parquet is ready!
+# (add --output-format csv to get traffic_timeseries.csv instead)
 
 # Step 4: Review visualizations
 # - density_timeline.png: Traffic patterns over time
@@ -1,8 +1,7 @@
-
 import streamlit as st
-import time
 import pandas as pd
 import sys
+from itertools import islice
 from pathlib import Path
 import altair as alt
 
@@ -31,14 +30,13 @@ st.sidebar.header("🔬 Lab Controls")
 
 st.sidebar.subheader("Stochastic Parameters")
 # Arrival Rates
-for lane_id in junction.lanes:
-    rate = st.sidebar.slider(
+for lane_id, lane in junction.lanes.items():
+    lane.arrival_rate = st.sidebar.slider(
         f"Arrival Rate ({lane_id}) λ", 
         min_value=0.0, max_value=30.0, step=0.5,
-        value=float(junction.lanes[lane_id].arrival_rate),
+        value=float(lane.arrival_rate),
         help="Vehicles per minute (Poisson)"
     )
-    junction.lanes[lane_id].arrival_rate = rate
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("Logic Thresholds")
@@ -67,73 +65,95 @@ auto_refresh = st.sidebar.checkbox("Run Simulation", value=True)
 st.title("🚦 Discrete Event Traffic Management System")
 st.markdown(f"**Grid ID:** G-YEL-001 | **Algorithm:** Weighted Priority (Queue + Wait Time)")
 
-# Metrics Row
-col1, col2, col3, col4 = st.columns(4)
-
-active_lane = junction.active_lane_id
-active_color = "normal" if junction.lanes[active_lane].queue_length < 20 else "inverse"
-green_duration = junction.sim_time - junction.last_switch_time
-
-with col1:
-    st.metric("Active Lane (Green)", active_lane, delta="Priority", delta_color=active_color)
-with col2:
-    st.metric("Green Timer", f"{green_duration:.1f}s")
-with col3:
-    total_q = sum(l.queue_length for l in junction.lanes.values())
-    st.metric("Total Congestion", int(total_q), delta=f"{int(total_q/4)} avg/lane")
-with col4:
-    last_event = junction.events_log[-1]['event'] if junction.events_log else "None"
-    st.metric("Last Discrete Event", last_event)
-
 
 # ==============================================================================
 # 3. Visualization (Charts & Stats)
 # ==============================================================================
 
-# Prepare Data
-lane_data = []
-for lid, lane in junction.lanes.items():
-    stats = lane.process_traffic(0) # Logic hack: get stats without discharging? No, simulator handles discharge in step.
-    # We access properties directly
-    lane_data.append({
-        "Lane": lid,
-        "Queue": lane.queue_length,
-        "Status": "Active" if lid == active_lane else "Waiting",
-        "Wait Time": round(junction.sim_time - junction.lane_last_green_times[lid], 1) if lid != active_lane else 0,
-        "Passed": lane.vehicles_passed
-    })
-df_lanes = pd.DataFrame(lane_data)
-
-# Row 1: Queue Chart (Altair)
-st.subheader("Real-time Queue Status")
-chart = alt.Chart(df_lanes).mark_bar().encode(
-    x=alt.X('Lane', axis=alt.Axis(labelAngle=0)),
-    y='Queue',
-    color=alt.Color('Status', scale=alt.Scale(domain=['Active', 'Waiting'], range=['#2ecc71', '#e74c3c'])),
-    tooltip=['Lane', 'Queue', 'Wait Time']
-).properties(height=300)
-
-st.altair_chart(chart, use_container_width=True)
-
-# Row 2: Throughput & Logic Log
-c1, c2 = st.columns([1, 2])
-
-with c1:
-    st.subheader("Throughput Stats")
-    st.dataframe(df_lanes[["Lane", "Passed", "Wait Time"]], hide_index=True)
-
-with c2:
-    st.subheader("System Event Log")
-    if junction.events_log:
-        log_df = pd.DataFrame(junction.events_log)
-        st.dataframe(log_df.iloc[::-1].head(10), use_container_width=True) # Show latest 10
-    else:
-        st.info("No switching events triggered yet.")
+def lane_snapshot(junction: JunctionManager) -> tuple:
+    """Per-lane state rows: (lane, queue, status, wait time, passed)"""
+    active_lane = junction.active_lane_id
+    rows = []
+    for lid, lane in junction.lanes.items():
+        # We access properties directly
+        rows.append((
+            lid,
+            lane.queue_length,
+            "Active" if lid == active_lane else "Waiting",
+            round(junction.sim_time - junction.lane_last_green_times[lid], 1) if lid != active_lane else 0,
+            lane.vehicles_passed
+        ))
+    return tuple(rows)
+
+
+def render_metrics(junction: JunctionManager):
+    # Metrics Row
+    col1, col2, col3, col4 = st.columns(4)
+
+    lanes = list(junction.lanes.values())
+    active_lane = junction.active_lane_id
+    active_color = "normal" if junction.lanes[active_lane].queue_length < 20 else "inverse"
+    green_duration = junction.sim_time - junction.last_switch_time
+
+    with col1:
+        st.metric("Active Lane (Green)", active_lane, delta="Priority", delta_color=active_color)
+    with col2:
+        st.metric("Green Timer", f"{green_duration:.1f}s")
+    with col3:
+        total_q = sum(l.queue_length for l in lanes)
+        st.metric("Total Congestion", int(total_q), delta=f"{int(total_q/len(lanes))} avg/lane")
+    with col4:
+        last_event = junction.events_log[-1]['event'] if junction.events_log else "None"
+        st.metric("Last Discrete Event", last_event)
+
+
+def render_lanes(junction: JunctionManager):
+    # Lane state changes nearly every tick, so the frame is rebuilt each time
+    snapshot = lane_snapshot(junction)
+    df_lanes = pd.DataFrame(list(snapshot), columns=["Lane", "Queue", "Status", "Wait Time", "Passed"])
+
+    # Row 1: Queue Chart (Altair)
+    st.subheader("Real-time Queue Status")
+    chart = alt.Chart(df_lanes).mark_bar().encode(
+        x=alt.X('Lane', axis=alt.Axis(labelAngle=0)),
+        y='Queue',
+        color=alt.Color('Status', scale=alt.Scale(domain=['Active', 'Waiting'], range=['#2ecc71', '#e74c3c'])),
+        tooltip=['Lane', 'Queue', 'Wait Time']
+    ).properties(height=300)
+    st.altair_chart(chart, use_container_width=True)
+
+    # Row 2: Throughput & Logic Log
+    c1, c2 = st.columns([1, 2])
+
+    with c1:
+        st.subheader("Throughput Stats")
+        st.dataframe(
+            [{"Lane": lid, "Passed": passed, "Wait Time": wait} for lid, _, _, wait, passed in snapshot],
+            hide_index=True
+        )
+
+    with c2:
+        st.subheader("System Event Log")
+        if junction.events_log:
+            log_df = pd.DataFrame(list(islice(reversed(junction.events_log), 10)))
+            log_df["time"] = log_df["time"].map("{:.1f}s".format)
+            st.dataframe(log_df, use_container_width=True) # Show latest 10
+        else:
+            st.info("No switching events triggered yet.")
+
 
 # ==============================================================================
-# 4. Simulation Loop (At End)
+# 4. Simulation Loop
 # ==============================================================================
-if auto_refresh:
-    junction.step(dt=1.0 * simulation_speed)
-    time.sleep(1.0 / simulation_speed)
-    st.rerun()
+# Only this fragment re-runs on the timer; the sidebar, header and session
+# state are left alone until a widget changes
+@st.fragment(run_every=1.0 / simulation_speed if auto_refresh else None)
+def sim_tick():
+    junction = st.session_state.junction
+    if auto_refresh:
+        junction.step(dt=1.0 * simulation_speed)
+    render_metrics(junction)
+    render_lanes(junction)
+
+
+sim_tick()
@@ -4,18 +4,17 @@ Processes traffic video using VehicleNet-Y26s and generates time-series dataset
 """
 
 import argparse
-import json
 import sys
 from pathlib import Path
 from datetime import datetime
 
+import orjson
+
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
-from vehicle_classifier import VehicleClassifier
-from density_calculator import DensityCalculator
-from time_series_generator import TimeSeriesGenerator
-from visualizer import TrafficVisualizer
+# Pipeline modules pull in torch, ultralytics and matplotlib, so each step
+# imports its own module; --help and argument errors exit without them
 
 
 def check_hf_auth():
@@ -51,14 +50,39 @@ def main():
                        help='Time bin size in seconds (overrides --bin-size if set)')
     parser.add_argument('--confidence', type=float, default=0.25,
                        help='Detection confidence threshold (default: 0.25)')
+    parser.add_argument('--precision', type=str, default='fp32',
+                       choices=['fp32', 'fp16', 'int8'],
+                       help='Inference precision; fp16/int8 need a CUDA GPU (default: fp32)')
+    parser.add_argument('--tensorrt', action='store_true',
+                       help='Run inference through a cached TensorRT engine (CUDA only)')
+    parser.add_argument('--calibration-data', type=str, default=None,
+                       help='Dataset YAML for int8 calibration (required with --precision int8)')
     parser.add_argument('--frame-skip', type=int, default=1,
                        help='Process every Nth frame (default: 1 = all frames)')
+    parser.add_argument('--batch-size', type=int, default=8,
+                       help='Frames per model forward pass (default: 8)')
+    parser.add_argument('--imgsz', type=int, default=640,
+                       help='Inference image size in pixels, longest side (default: 640)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Worker processes, each detecting on a chunk of the video (default: 1)')
     parser.add_argument('--roi', type=str, default=None,
                        help='Region of Interest as "x1,y1,x2,y2" (default: full frame)')
+    parser.add_argument('--output-format', type=str, default='parquet',
+                       choices=['csv', 'parquet'],
+                       help='Time-series dataset format (default: parquet)')
     parser.add_argument('--start-datetime', type=str, default=None,
                        help='Start datetime in ISO format (default: epoch)')
     parser.add_argument('--no-video', action='store_true',
                        help='Skip saving annotated video (faster processing)')
+    parser.add_argument('--codec-hint', type=str, default='mp4v',
+                       choices=['mp4v', 'mjpeg', 'nvenc'],
+                       help='Annotated video codec; mjpeg is faster to encode and seek, '
+                            'nvenc encodes on the GPU (default: mp4v)')
+    parser.add_argument('--hw-decode', action='store_true',
+                       help='Use hardware-accelerated video decoding when available')
+    parser.add_argument('--decoder', type=str, default='opencv',
+                       choices=['opencv', 'pyav'],
+                       help='Video decoder; pyav needs the av package (default: opencv)')
     parser.add_argument('--skip-auth-check', action='store_true',
                        help='Skip Hugging Face authentication check')
     
@@ -70,6 +94,10 @@ def main():
         print(f"✗ Error: Video file not found: {args.video}")
         sys.exit(1)
     
+    if args.precision == 'int8' and args.calibration_data is None:
+        print("✗ Error: --precision int8 requires --calibration-data")
+        sys.exit(1)
+    
     # Parse ROI if provided
     roi = None
     if args.roi:
@@ -103,7 +131,9 @@ def main():
         print(f"Bin Size: {args.bin_size} minutes")
         
     print(f"Confidence: {args.confidence}")
+    print(f"Precision: {args.precision}")
     print(f"Frame Skip: {args.frame_skip}")
+    print(f"Batch Size: {args.batch_size}")
     print()
     
     # Check HF authentication
@@ -118,9 +148,15 @@ def main():
     print("STEP 1: VEHICLE CLASSIFICATION")
     print("=" * 70)
     
+    from vehicle_classifier import VehicleClassifier
+    
     classifier = VehicleClassifier(
         confidence_threshold=args.confidence,
-        device='auto'
+        device='auto',
+        precision=args.precision,
+        calibration_data=args.calibration_data,
+        imgsz=args.imgsz,
+        tensorrt=args.tensorrt
     )
     
     if not classifier.load_model():
@@ -133,7 +169,12 @@ def main():
         output_dir=str(output_dir),
         roi=roi,
         save_annotated=not args.no_video,
-        frame_skip=args.frame_skip
+        frame_skip=args.frame_skip,
+        codec=args.codec_hint,
+        hw_decode=args.hw_decode,
+        decoder=args.decoder,
+        batch_size=args.batch_size,
+        workers=args.workers
     )
     
     # Print detection summary
@@ -154,12 +195,18 @@ def main():
     print("STEP 2: WEIGHTED DENSITY CALCULATION")
     print("=" * 70)
     
+    from density_calculator import DensityCalculator
+    
     calculator = DensityCalculator(weights_config_path=str(weights_config))
     
-    density_data = calculator.calculate_all_frames(detections)
+    density_data = calculator.calculate_all_frames(
+        detections,
+        detection_array=classifier.detection_array,
+        class_names=classifier.class_names
+    )
     
     # Save density data
-    density_file = output_dir / 'density_data.json'
+    density_file = output_dir / 'density_data.jsonl'
     calculator.save_density_data(density_data, str(density_file))
     
     # Print density statistics
@@ -177,6 +224,8 @@ def main():
     print("STEP 3: TIME-SERIES DATASET GENERATION")
     print("=" * 70)
     
+    from time_series_generator import TimeSeriesGenerator
+    
     ts_generator = TimeSeriesGenerator(bin_size_minutes=bin_size)
     
     ts_df = ts_generator.aggregate_to_timeseries(
@@ -185,7 +234,7 @@ def main():
     )
     
     # Save time-series dataset
-    ts_file = output_dir / 'traffic_timeseries.csv'
+    ts_file = output_dir / f'traffic_timeseries.{args.output_format}'
     ts_generator.save_timeseries(ts_df, str(ts_file))
     
     # Print time-series summary
@@ -205,6 +254,8 @@ def main():
     print("STEP 4: GENERATING VISUALIZATIONS")
     print("=" * 70)
     
+    from visualizer import TrafficVisualizer
+    
     visualizer = TrafficVisualizer()
     
     # Create plots
@@ -213,6 +264,7 @@ def main():
     visualizer.plot_heatmap(ts_df, str(output_dir / 'vehicle_heatmap.png'))
     visualizer.create_summary_dashboard(ts_df, ts_summary, 
                                        str(output_dir / 'summary_dashboard.png'))
+    visualizer.close()
     
     # ========================================================================
     # STEP 5: Save Final Summary
@@ -237,8 +289,9 @@ def main():
     }
     
     summary_file = output_dir / 'analysis_summary.json'
-    with open(summary_file, 'w') as f:
-        json.dump(final_summary, f, indent=2)
+    with open(summary_file, 'wb') as f:
+        f.write(orjson.dumps(final_summary,
+                             option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"✓ Analysis summary saved to: {summary_file}")
     
@@ -250,10 +303,10 @@ def main():
     print("=" * 70)
     print("\nOutput Files:")
     print(f"  1. Time-Series Dataset: {ts_file}")
-    print(f"  2. Detections (JSON): {output_dir / 'detections.json'}")
-    print(f"  3. Density Data (JSON): {density_file}")
-    if not args.no_video:
-        print(f"  4. Annotated Video: {output_dir / 'annotated_video.mp4'}")
+    print(f"  2. Detections (JSONL): {output_dir / 'detections.jsonl'}")
+    print(f"  3. Density Data (JSONL): {density_file}")
+    if classifier.annotated_video_path:
+        print(f"  4. Annotated Video: {classifier.annotated_video_path}")
     print(f"  5. Density Timeline: {output_dir / 'density_timeline.png'}")
     print(f"  6. Vehicle Distribution: {output_dir / 'vehicle_distribution.png'}")
     print(f"  7. Vehicle Heatmap: {output_dir / 'vehicle_heatmap.png'}")
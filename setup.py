@@ -6,6 +6,7 @@ Guides user through Hugging Face authentication
 
 import sys
 import os
+import importlib.util
 from pathlib import Path
 
 
@@ -24,15 +25,13 @@ def check_dependencies():
         'torch'
     ]
     
+    # find_spec locates a package without importing it, so torch and
+    # ultralytics are not loaded just to confirm they exist
     missing = []
     for package in required_packages:
-        try:
-            if package == 'cv2':
-                __import__('cv2')
-            else:
-                __import__(package)
+        if importlib.util.find_spec(package) is not None:
             print(f"  ✓ {package}")
-        except ImportError:
+        else:
             print(f"  ✗ {package} - MISSING")
             missing.append(package)
     
@@ -4,9 +4,106 @@ Computes weighted traffic density based on vehicle classifications
 """
 
 import json
+import orjson
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
 import numpy as np
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional; fall back to the NumPy kernel
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _reduce_frame(areas, class_ids, weights, counts):
+        """Weighted and raw area sums of one frame; class counts go into counts"""
+        tw = 0.0
+        tr = 0.0
+        for j in range(areas.size):
+            c = class_ids[j]
+            tw += areas[j] * weights[c]
+            tr += areas[j]
+            counts[c] += 1
+        return tw, tr
+    
+    @njit(cache=True, fastmath=True)
+    def _density_serial(offsets, class_ids, areas, weights, n_classes):
+        """Per-frame weighted/raw area sums and class counts (CSR layout)"""
+        n_frames = offsets.size - 1
+        total_weighted = np.zeros(n_frames)
+        total_raw = np.zeros(n_frames)
+        type_counts = np.zeros((n_frames, n_classes), dtype=np.int64)
+        for i in range(n_frames):
+            start, end = offsets[i], offsets[i + 1]
+            total_weighted[i], total_raw[i] = _reduce_frame(
+                areas[start:end], class_ids[start:end], weights, type_counts[i]
+            )
+        return total_weighted, total_raw, type_counts
+    
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _density_parallel(offsets, class_ids, areas, weights, n_classes):
+        """Multi-core version of _density_serial; frames are split across threads"""
+        n_frames = offsets.size - 1
+        total_weighted = np.zeros(n_frames)
+        total_raw = np.zeros(n_frames)
+        type_counts = np.zeros((n_frames, n_classes), dtype=np.int64)
+        for i in prange(n_frames):
+            start, end = offsets[i], offsets[i + 1]
+            total_weighted[i], total_raw[i] = _reduce_frame(
+                areas[start:end], class_ids[start:end], weights, type_counts[i]
+            )
+        return total_weighted, total_raw, type_counts
+    
+    # Below this many frames, thread start-up costs more than the reduction
+    PARALLEL_MIN_FRAMES = 1000
+    
+    def _density_kernel(offsets: np.ndarray, class_ids: np.ndarray, areas: np.ndarray,
+                        weights: np.ndarray, n_classes: int) -> Tuple[np.ndarray, ...]:
+        """Per-frame weighted/raw area sums and class counts (CSR layout)"""
+        if offsets.size - 1 >= PARALLEL_MIN_FRAMES:
+            return _density_parallel(offsets, class_ids, areas, weights, n_classes)
+        return _density_serial(offsets, class_ids, areas, weights, n_classes)
+    
+    @njit(cache=True)
+    def _summary_stats(x):
+        """(sum, mean, min, max, std) of a non-empty array in one pass"""
+        mn = x[0]
+        mx = x[0]
+        total = 0.0
+        mean = 0.0
+        m2 = 0.0
+        for i in range(x.size):
+            v = x[i]
+            mn = min(mn, v)
+            mx = max(mx, v)
+            total += v
+            # Welford update keeps the variance stable in a single pass
+            delta = v - mean
+            mean += delta / (i + 1)
+            m2 += delta * (v - mean)
+        return total, mean, mn, mx, np.sqrt(m2 / x.size)
+else:
+    def _summary_stats(x: np.ndarray) -> Tuple:
+        """(sum, mean, min, max, std) of a non-empty array"""
+        return x.sum(), x.mean(), x.min(), x.max(), x.std()
+    
+    def _density_kernel(offsets: np.ndarray, class_ids: np.ndarray, areas: np.ndarray,
+                        weights: np.ndarray, n_classes: int) -> Tuple[np.ndarray, ...]:
+        """Per-frame weighted/raw area sums and class counts (CSR layout)"""
+        n_frames = offsets.size - 1
+        # bincount keeps frames without detections at zero
+        frame_ids = np.repeat(np.arange(n_frames), np.diff(offsets))
+        total_weighted = np.bincount(frame_ids, weights=weights[class_ids] * areas,
+                                     minlength=n_frames)
+        total_raw = np.bincount(frame_ids, weights=areas, minlength=n_frames)
+        type_counts = np.bincount(frame_ids * n_classes + class_ids,
+                                  minlength=n_frames * n_classes).reshape(n_frames, n_classes)
+        return total_weighted, total_raw, type_counts
 
 
 class DensityCalculator:
@@ -24,14 +121,50 @@ class DensityCalculator:
         with open(weights_config_path, 'r') as f:
             config = json.load(f)
         self.vehicle_weights = config['vehicle_weights']
+        
+        # Dense weight lookup indexed by integer class id. Classes missing
+        # from the config are appended on first sight with weight 1.0
+        self.class_names = list(self.vehicle_weights.keys())
+        self._class_to_idx = {name: i for i, name in enumerate(self.class_names)}
+        self.weights_arr = np.array(list(self.vehicle_weights.values()), dtype=np.float64)
+        
         print(f"✓ Loaded weights for {len(self.vehicle_weights)} vehicle types")
     
-    def calculate_frame_density(self, frame_data: Dict) -> Dict:
+    def _class_index(self, vehicle_class: str) -> int:
+        """Map a class name to its integer id, registering unknown classes"""
+        idx = self._class_to_idx.get(vehicle_class)
+        if idx is None:
+            idx = len(self.class_names)
+            self.class_names.append(vehicle_class)
+            self._class_to_idx[vehicle_class] = idx
+            self.weights_arr = np.append(self.weights_arr, 1.0)
+        return idx
+    
+    def _detection_arrays(self, detections: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Class ids and bbox areas of detection dicts as parallel arrays"""
+        classes = list(map(itemgetter('class'), detections))
+        # Register unseen classes first so every name is a plain dict lookup
+        for name in dict.fromkeys(classes):
+            if name not in self._class_to_idx:
+                self._class_index(name)
+        
+        class_ids = np.fromiter(map(self._class_to_idx.__getitem__, classes),
+                                dtype=np.int64, count=len(classes))
+        areas = np.fromiter(map(itemgetter('bbox_area'), detections),
+                            dtype=np.float64, count=len(classes))
+        return class_ids, areas
+    
+    def calculate_frame_density(self, frame_data: Dict,
+                                class_names: Optional[List[str]] = None) -> Dict:
         """
         Calculate weighted density for a single frame
         
         Args:
             frame_data: Frame detection data with 'detections' and 'roi_area'
+            class_names: Class name table indexed by frame_data['class_ids'].
+                         When given, classes and areas are read from the
+                         frame's 'class_ids'/'bbox_areas' arrays instead of
+                         the per-detection dicts.
             
         Returns:
             Dictionary with density metrics
@@ -42,24 +175,27 @@ class DensityCalculator:
         if roi_area == 0:
             raise ValueError("ROI area cannot be zero")
         
-        # Calculate weighted area sum
-        total_weighted_area = 0
-        total_raw_area = 0
-        vehicle_counts = {}
+        # Class ids and areas as arrays, reduced against the weight lookup table
+        n_dets = len(detections)
+        if class_names is not None:
+            class_lut = np.array([self._class_index(name) for name in class_names],
+                                 dtype=np.int64)
+            class_ids = class_lut[frame_data['class_ids']]
+            areas = frame_data['bbox_areas'].astype(np.float64)
+        else:
+            class_ids, areas = self._detection_arrays(detections)
         
-        for det in detections:
-            vehicle_class = det['class']
-            bbox_area = det['bbox_area']
-            
-            # Get weight (default to 1.0 if class not in config)
-            weight = self.vehicle_weights.get(vehicle_class, 1.0)
-            
-            # Accumulate weighted area
-            total_weighted_area += bbox_area * weight
-            total_raw_area += bbox_area
-            
-            # Count vehicles by type
-            vehicle_counts[vehicle_class] = vehicle_counts.get(vehicle_class, 0) + 1
+        # Same kernel as calculate_all_frames, over a single CSR frame
+        offsets = np.array([0, n_dets], dtype=np.int64)
+        total_weighted, total_raw, type_counts = _density_kernel(
+            offsets, class_ids, areas, self.weights_arr, len(self.class_names)
+        )
+        total_weighted_area = float(total_weighted[0])
+        total_raw_area = float(total_raw[0])
+        
+        # Count vehicles by type
+        counts = type_counts[0]
+        vehicle_counts = {self.class_names[c]: int(counts[c]) for c in np.flatnonzero(counts)}
         
         # Calculate density metrics
         weighted_density = (total_weighted_area / roi_area) * 100
@@ -81,21 +217,85 @@ class DensityCalculator:
         
         return density_metrics
     
-    def calculate_all_frames(self, frame_detections: List[Dict]) -> List[Dict]:
+    def calculate_all_frames(self, frame_detections: List[Dict],
+                             detection_array: Optional[np.ndarray] = None,
+                             class_names: Optional[List[str]] = None) -> List[Dict]:
         """
         Calculate density for all frames
         
         Args:
             frame_detections: List of frame detection data
+            detection_array: Optional DETECTION_DTYPE array of the same
+                             detections (see VehicleClassifier.detection_array).
+                             When given, classes and areas are read from its
+                             columns instead of the per-detection dicts.
+            class_names: Class name table indexed by detection_array['cls']
             
         Returns:
             List of density metrics per frame
         """
-        density_data = []
+        if not frame_detections:
+            return []
+        
+        n_frames = len(frame_detections)
+        roi_areas = np.fromiter((f['roi_area'] for f in frame_detections),
+                                dtype=np.float64, count=n_frames)
+        if np.any(roi_areas == 0):
+            raise ValueError("ROI area cannot be zero")
         
-        for frame_data in frame_detections:
-            metrics = self.calculate_frame_density(frame_data)
-            density_data.append(metrics)
+        # Parallel class/area arrays over all detections; frame i owns the
+        # slice offsets[i]:offsets[i + 1]
+        if detection_array is not None:
+            if class_names is None:
+                raise ValueError("class_names is required with detection_array")
+            class_lut = np.array([self._class_index(name) for name in class_names],
+                                 dtype=np.int64)
+            class_ids = class_lut[detection_array['cls']]
+            areas = ((detection_array['x2'] - detection_array['x1']) *
+                     (detection_array['y2'] - detection_array['y1'])).astype(np.float64)
+            offsets = np.searchsorted(detection_array['frame'], np.arange(n_frames + 1))
+            per_frame = np.diff(offsets)
+        else:
+            per_frame = np.fromiter((len(f['detections']) for f in frame_detections),
+                                    dtype=np.int64, count=n_frames)
+            offsets = np.zeros(n_frames + 1, dtype=np.int64)
+            np.cumsum(per_frame, out=offsets[1:])
+            class_ids, areas = self._detection_arrays(
+                list(chain.from_iterable(f['detections'] for f in frame_detections))
+            )
+        
+        total_weighted, total_raw, type_counts = _density_kernel(
+            offsets, class_ids, areas, self.weights_arr, len(self.class_names)
+        )
+        
+        weighted_density = total_weighted / roi_areas * 100
+        raw_density = total_raw / roi_areas * 100
+        occupancy = np.minimum(weighted_density, 100.0)  # Cap at 100%
+        
+        # Bulk-convert columns to Python scalars once instead of per value
+        vehicle_count = per_frame.tolist()
+        weighted_density, raw_density, occupancy = (
+            weighted_density.tolist(), raw_density.tolist(), occupancy.tolist()
+        )
+        total_weighted, total_raw = total_weighted.tolist(), total_raw.tolist()
+        
+        density_data = []
+        for i, frame_data in enumerate(frame_detections):
+            row = type_counts[i]
+            nonzero = np.flatnonzero(row)
+            density_data.append({
+                'frame_idx': frame_data['frame_idx'],
+                'timestamp': frame_data['timestamp'],
+                'vehicle_count': vehicle_count[i],
+                'vehicle_counts_by_type': dict(zip([self.class_names[c] for c in nonzero],
+                                                   row[nonzero].tolist())),
+                'weighted_density': weighted_density[i],
+                'raw_density': raw_density[i],
+                'occupancy_percentage': occupancy[i],
+                'total_weighted_area': total_weighted[i],
+                'total_raw_area': total_raw[i],
+                'roi_area': frame_data['roi_area']
+            })
         
         return density_data
     
@@ -107,30 +307,35 @@ class DensityCalculator:
             density_data: List of density metrics
             
         Returns:
-            Dictionary with statistics
+            Dictionary with statistics. Values may be NumPy scalars; serialize
+            with orjson.OPT_SERIALIZE_NUMPY
         """
         if not density_data:
             return {}
         
-        weighted_densities = [d['weighted_density'] for d in density_data]
-        vehicle_counts = [d['vehicle_count'] for d in density_data]
+        weighted_densities = np.fromiter((d['weighted_density'] for d in density_data),
+                                         dtype=np.float64, count=len(density_data))
+        vehicle_counts = np.fromiter((d['vehicle_count'] for d in density_data),
+                                     dtype=np.int64, count=len(density_data))
         
         # Aggregate vehicle counts by type
-        total_by_type = {}
+        total_by_type = Counter()
         for frame in density_data:
-            for vtype, count in frame['vehicle_counts_by_type'].items():
-                total_by_type[vtype] = total_by_type.get(vtype, 0) + count
+            total_by_type.update(frame['vehicle_counts_by_type'])
+        
+        _, avg_density, min_density, max_density, std_density = _summary_stats(weighted_densities)
+        total_vehicles, avg_count, _, max_count, _ = _summary_stats(vehicle_counts)
         
         stats = {
             'total_frames': len(density_data),
-            'avg_weighted_density': float(np.mean(weighted_densities)),
-            'max_weighted_density': float(np.max(weighted_densities)),
-            'min_weighted_density': float(np.min(weighted_densities)),
-            'std_weighted_density': float(np.std(weighted_densities)),
-            'avg_vehicle_count': float(np.mean(vehicle_counts)),
-            'max_vehicle_count': int(np.max(vehicle_counts)),
-            'total_vehicles_detected': int(sum(vehicle_counts)),
-            'vehicle_distribution': total_by_type
+            'avg_weighted_density': avg_density,
+            'max_weighted_density': max_density,
+            'min_weighted_density': min_density,
+            'std_weighted_density': std_density,
+            'avg_vehicle_count': avg_count,
+            'max_vehicle_count': max_count,
+            'total_vehicles_detected': int(total_vehicles),
+            'vehicle_distribution': dict(total_by_type)
         }
         
         return stats
@@ -139,14 +344,23 @@ class DensityCalculator:
         """
         Save density data to JSON file
         
+        A '.jsonl' path is written as newline-delimited JSON, one frame per
+        line, so no serialized copy of the whole list is held in memory.
+        
         Args:
             density_data: List of density metrics
-            output_path: Path to save JSON file
+            output_path: Path to save JSON (or JSON Lines) file
         """
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w') as f:
-            json.dump(density_data, f, indent=2)
+        with open(output_file, 'wb') as f:
+            if output_file.suffix == '.jsonl':
+                for record in density_data:
+                    f.write(orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY))
+                    f.write(b'\n')
+            else:
+                f.write(orjson.dumps(density_data,
+                                     option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         
         print(f"✓ Density data saved to: {output_file}")
@@ -1,8 +1,59 @@
 
+from collections import deque
 from typing import Dict, List, Optional
-import time
+import numpy as np
 from traffic_simulator import TrafficSimulator
 
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the decision kernel then runs as Python
+    njit = None
+
+
+# Reason codes returned by _evaluate_switch
+NO_SWITCH, LANE_EMPTY, MAX_TIME_EXPIRED, PRIORITY_OVERRIDE = range(4)
+
+
+def _evaluate_switch(sim_time, active, last_switch, queue_lengths, last_green_times,
+                     alpha, min_green, max_green, queue_threshold):
+    """
+    Weighted-priority switch decision over lanes indexed 0..N-1
+    
+    Returns:
+        (best candidate lane, reason code, best candidate score, active score)
+    """
+    state_duration = sim_time - last_switch
+    
+    # Constraints
+    if state_duration < min_green:
+        return -1, NO_SWITCH, 0.0, 0.0 # Must hold green
+    
+    # Score = Queue + (Alpha * WaitTime); the active lane has no wait penalty
+    current_score = queue_lengths[active]
+    if queue_lengths.size < 2:
+        return -1, NO_SWITCH, 0.0, current_score
+    scores = queue_lengths + alpha * (sim_time - last_green_times)
+    scores[active] = -np.inf # Only other lanes are candidates
+    best = np.argmax(scores)
+    best_score = scores[best]
+    
+    # 1. Empty Lane Optimization (Highest Level)
+    if queue_lengths[active] <= 0 and best_score > 5:
+        reason = LANE_EMPTY
+    # 2. Hard Limits (Max Time)
+    elif state_duration >= max_green:
+        reason = MAX_TIME_EXPIRED
+    # 3. Weighted Priority Switch
+    elif best_score > current_score + queue_threshold:
+        reason = PRIORITY_OVERRIDE
+    else:
+        reason = NO_SWITCH
+    return best, reason, best_score, current_score
+
+
+if njit is not None:
+    _evaluate_switch = njit(cache=True)(_evaluate_switch)
+
 class JunctionManager:
     """
     Manages a 4-way junction with Discrete Event Logic and Weighted Priority.
@@ -13,7 +64,17 @@ class JunctionManager:
     - Weighted Priority: Queue Length + (Alpha * Wait Time)
     """
     
-    def __init__(self, config: Optional[Dict] = None):
+    # Number of switch events kept for display; older ones are dropped
+    EVENT_LOG_SIZE = 1000
+    
+    def __init__(self, config: Optional[Dict] = None,
+                 rng: Optional[np.random.Generator] = None):
+        """
+        Args:
+            config: Overrides for the default configuration
+            rng: Random generator shared by all lanes (a new PCG64 one if
+                 None). Pass np.random.default_rng(seed) for repeatable runs.
+        """
         # Default Configuration
         self.config = {
             "min_green_time": 5.0,
@@ -28,22 +89,47 @@ class JunctionManager:
         if config:
             self.config.update(config)
 
-        # 4 Lanes
+        # 4 Lanes, sharing one random generator
+        self.rng = rng if rng is not None else np.random.default_rng()
         rates = self.config["arrival_rates"]
         self.lanes = {
-            lid: TrafficSimulator(lid, arrival_rate_per_min=rate) 
+            lid: TrafficSimulator(lid, arrival_rate_per_min=rate, rng=self.rng) 
             for lid, rate in rates.items()
         }
         
+        # Optional pre-drawn arrivals, see prebuild_arrivals
+        self._arrivals_table = None
+        self._arrival_offsets = None
+        self._arrival_types = []
+        self._arrivals_dt = 0.0
+        self._arrivals_pos = 0
+        
+        # Lanes are indexed 0..N-1 internally; names are kept for display
+        self.lane_ids = list(self.lanes)
+        self._lane_list = list(self.lanes.values())
+        self._lane_index = {lid: i for i, lid in enumerate(self.lane_ids)}
+        
         # State
-        self.active_lane_id = "North"
+        self.active_lane = self._lane_index.get("North", 0)
         self.sim_time = 0.0
         self.last_switch_time = 0.0
         
-        # Track when each lane was last green (sim_time)
-        self.lane_last_green_times = {lid: 0.0 for lid in self.lanes}
+        # Per-lane arrays: queue lengths (refreshed each decision) and when
+        # each lane was last green (sim_time)
+        self.queue_lengths = np.zeros(len(self.lane_ids), dtype=np.float64)
+        self.last_green_times = np.zeros(len(self.lane_ids), dtype=np.float64)
         
-        self.events_log = [] 
+        self.events_log = deque(maxlen=self.EVENT_LOG_SIZE)
+
+    @property
+    def active_lane_id(self) -> str:
+        """Name of the lane that currently has green"""
+        return self.lane_ids[self.active_lane]
+
+    @property
+    def lane_last_green_times(self) -> Dict[str, float]:
+        """Last green time (sim_time) of each lane by name"""
+        return dict(zip(self.lane_ids, self.last_green_times.tolist()))
 
     def step(self, dt: float = 1.0) -> Dict:
         """
@@ -70,81 +156,85 @@ class JunctionManager:
             "sim_time": self.sim_time
         }
 
+    def prebuild_arrivals(self, n_steps: int, dt: float = 1.0):
+        """
+        Draw arrivals for the next n_steps steps of length dt at once.
+        
+        Per-lane arrival counts come from one Poisson call, and the types of
+        all vehicles a lane will receive from one draw per lane. Steps with a
+        different dt, and steps past the end of the table, fall back to
+        drawing per tick. Arrival rates are read when the table is built, so
+        later rate changes apply only after it runs out.
+        """
+        rates = np.array([lane.arrival_rate for lane in self._lane_list], dtype=np.float64)
+        lam = rates / 60.0 * dt
+        self._arrivals_table = self.rng.poisson(lam[:, None], size=(len(rates), n_steps))
+        
+        # Lane i's vehicles for step t are
+        # _arrival_types[i][_arrival_offsets[i, t]:_arrival_offsets[i, t + 1]]
+        self._arrival_offsets = np.zeros((len(rates), n_steps + 1), dtype=np.int64)
+        np.cumsum(self._arrivals_table, axis=1, out=self._arrival_offsets[:, 1:])
+        self._arrival_types = [lane.draw_type_ids(int(total))
+                               for lane, total in zip(self._lane_list, self._arrival_offsets[:, -1])]
+        self._arrivals_dt = dt
+        self._arrivals_pos = 0
+
     def update_arrivals(self, dt: float) -> Dict:
+        table = self._arrivals_table
         states = {}
-        for lid, lane in self.lanes.items():
-            states[lid] = lane.step(dt)
+        if table is not None and dt == self._arrivals_dt and self._arrivals_pos < table.shape[1]:
+            t = self._arrivals_pos
+            self._arrivals_pos += 1
+            for i, (lid, lane) in enumerate(self.lanes.items()):
+                start, end = self._arrival_offsets[i, t], self._arrival_offsets[i, t + 1]
+                states[lid] = lane.step(dt, type_ids=self._arrival_types[i][start:end])
+            return states
+        
+        # One vectorized Poisson draw for all lanes
+        rates = np.array([lane.arrival_rate for lane in self._lane_list], dtype=np.float64)
+        counts = self.rng.poisson(rates / 60.0 * dt)
+        for (lid, lane), count in zip(self.lanes.items(), counts.tolist()):
+            states[lid] = lane.step(dt, arrivals=count)
         return states
 
     def evaluate_switch_conditions(self) -> Optional[str]:
         """
         Determines if a switch is needed based on Weighted Priority & Constraints.
         """
-        state_duration = self.sim_time - self.last_switch_time
-        
-        # Constraints
-        if state_duration < self.config["min_green_time"]:
-            return None # Must hold green
-            
-        must_switch = state_duration >= self.config["max_green_time"]
-        
-        # Calculate Priority Scores for ALL lanes
-        # Score = Queue + (Alpha * WaitTime)
-        scores = {}
-        for lid, lane in self.lanes.items():
-            wait_time = self.sim_time - self.lane_last_green_times[lid]
-            if lid == self.active_lane_id:
-                wait_time = 0 # Currently active, no wait penalty
-            
-            score = lane.queue_length + (self.config["alpha_wait_weight"] * wait_time)
-            scores[lid] = score
-            
-        # Find highest priority candidate (excluding current if possible)
-        candidates = {k: v for k, v in scores.items() if k != self.active_lane_id}
-        if not candidates:
-            return None
-            
-        best_candidate = max(candidates, key=candidates.get)
-        best_score = candidates[best_candidate]
-        current_score = scores[self.active_lane_id]
+        self.queue_lengths[:] = [lane.queue_length for lane in self._lane_list]
         
-        current_lane_obj = self.lanes[self.active_lane_id]
+        best, reason, best_score, current_score = _evaluate_switch(
+            float(self.sim_time), self.active_lane, float(self.last_switch_time),
+            self.queue_lengths, self.last_green_times,
+            float(self.config["alpha_wait_weight"]), float(self.config["min_green_time"]),
+            float(self.config["max_green_time"]), float(self.config["queue_threshold"])
+        )
         
         # Decision Logic
-        trigger_reason = ""
-        
-        # 1. Empty Lane Optimization (Highest Level)
-        if current_lane_obj.queue_length <= 0 and best_score > 5:
-             trigger_reason = f"LANE_EMPTY ({self.active_lane_id})"
-             
-        # 2. Hard Limits (Max Time)
-        elif must_switch:
+        if reason == LANE_EMPTY:
+            trigger_reason = f"LANE_EMPTY ({self.active_lane_id})"
+        elif reason == MAX_TIME_EXPIRED:
             trigger_reason = f"MAX_TIME_EXPIRED (Active Score: {current_score:.1f})"
-            
-        # 3. Weighted Priority Switch
-        # Switch if Challenger Score is significantly higher than Current
-        # e.g., Challenger > Current * 1.5 OR Challenger > Current + Threshold
-        elif best_score > (current_score + self.config["queue_threshold"]):
-             trigger_reason = f"PRIORITY_OVERRIDE (Score {best_score:.1f} > {current_score:.1f})"
-             
-        if trigger_reason:
-            return self.execute_switch(best_candidate, trigger_reason)
-            
-        return None
+        elif reason == PRIORITY_OVERRIDE:
+            trigger_reason = f"PRIORITY_OVERRIDE (Score {best_score:.1f} > {current_score:.1f})"
+        else:
+            return None
+        
+        return self.execute_switch(self.lane_ids[best], trigger_reason)
 
     def execute_switch(self, target_lane: str, reason: str) -> str:
         self.events_log.append({
-            "time": f"{self.sim_time:.1f}s",
+            "time": self.sim_time, # sim seconds; formatted for display
             "event": "SHIFT_PRIORITY",
             "from": self.active_lane_id,
             "to": target_lane,
             "reason": reason
         })
-        self.active_lane_id = target_lane
+        self.active_lane = self._lane_index[target_lane]
         self.last_switch_time = self.sim_time
-        self.lane_last_green_times[target_lane] = self.sim_time
+        self.last_green_times[self.active_lane] = self.sim_time
         return reason
 
     def process_departures(self, dt: float):
-        active_lane = self.lanes[self.active_lane_id]
+        active_lane = self._lane_list[self.active_lane]
         active_lane.process_traffic(dt)
@@ -1,6 +1,4 @@
-
 import numpy as np
-import time
 from typing import Dict, List, Optional
 
 class TrafficSimulator:
@@ -13,20 +11,25 @@ class TrafficSimulator:
     - Variable Discharge Rates (Trucks slower than Cars)
     """
     
+    # Initial queue buffer size; buffers double when a lane outgrows it
+    QUEUE_CAPACITY = 256
+    
     def __init__(self, lane_id: str, arrival_rate_per_min: float = 10.0, 
-                 vehicle_probs: Optional[Dict[str, float]] = None):
+                 vehicle_probs: Optional[Dict[str, float]] = None,
+                 rng: Optional[np.random.Generator] = None):
         """
         Args:
             lane_id: Identifier for the lane
             arrival_rate_per_min: Lambda for Poisson distribution
             vehicle_probs: Dictionary of vehicle type probabilities
+            rng: Random generator to draw from (a new PCG64 one if None)
         """
         self.lane_id = lane_id
         self.arrival_rate = arrival_rate_per_min
+        self.rng = rng if rng is not None else np.random.default_rng()
         
         # Simulation Logic
         self.sim_time = 0.0
-        self.queue: List[Dict] = [] # List of {"type": str, "arrival_time": float}
         self.vehicles_passed = 0
         
         # Configuration
@@ -45,42 +48,90 @@ class TrafficSimulator:
             "Truck": 4.0   # Very Slow
         }
         
+        # Vehicle types are stored as ids into _type_names
+        self._type_names = list(self.vehicle_probs.keys())
+        probs = np.array(list(self.vehicle_probs.values()), dtype=np.float64)
+        self._type_probs = probs / probs.sum() # Normalize probs just in case
+        # Sampling table, built the way Generator.choice builds it per call
+        self._type_cdf = self._type_probs.cumsum()
+        self._type_cdf /= self._type_cdf[-1]
+        self._type_name_arr = np.array(self._type_names, dtype=object)
+        self._discharge_costs_arr = np.array(
+            [self.discharge_costs.get(t, 2.0) for t in self._type_names], dtype=np.float64
+        )
+        
+        # FIFO queue as parallel arrays; waiting vehicles are _head:_tail
+        self._types = np.empty(self.QUEUE_CAPACITY, dtype=np.int8)
+        self._arrivals = np.empty(self.QUEUE_CAPACITY, dtype=np.float64)
+        self._head = 0
+        self._tail = 0
+        
     @property
     def queue_length(self) -> int:
         """Backward compatibility for JunctionManager"""
-        return len(self.queue)
+        return self._tail - self._head
+    
+    def _enqueue(self, type_ids: np.ndarray, arrival_time: float):
+        """Append vehicles to the back of the queue"""
+        n = len(type_ids)
+        if self._tail + n > self._types.size:
+            # Move waiting vehicles to the front, growing the buffers if needed
+            live = self._tail - self._head
+            capacity = self._types.size
+            while live + n > capacity:
+                capacity *= 2
+            types = np.empty(capacity, dtype=np.int8)
+            arrivals = np.empty(capacity, dtype=np.float64)
+            types[:live] = self._types[self._head:self._tail]
+            arrivals[:live] = self._arrivals[self._head:self._tail]
+            self._types, self._arrivals = types, arrivals
+            self._head, self._tail = 0, live
+        
+        self._types[self._tail:self._tail + n] = type_ids
+        self._arrivals[self._tail:self._tail + n] = arrival_time
+        self._tail += n
+        
+    def draw_type_ids(self, n: int) -> np.ndarray:
+        """Draw n vehicle type ids (indexes into the vehicle_probs types)"""
+        # Same draws as rng.choice(n_types, p=...), minus its per-call checks
+        return self._type_cdf.searchsorted(self.rng.random(n), side='right')
         
-    def step(self, duration_seconds: float = 1.0) -> Dict:
+    def step(self, duration_seconds: float = 1.0, arrivals: Optional[int] = None,
+             type_ids: Optional[np.ndarray] = None) -> Dict:
         """
         Advance simulation by duration_seconds.
+        
+        Args:
+            duration_seconds: Simulated time to advance
+            arrivals: Number of arriving vehicles, already drawn by the
+                      caller. If None, it is drawn here from the lane's rate.
+            type_ids: Type ids of the arriving vehicles, already drawn by
+                      the caller (see draw_type_ids). Overrides arrivals.
         """
         self.sim_time += duration_seconds
         
         # 1. Stochastic Arrival (Poisson Process)
-        lam = (self.arrival_rate / 60.0) * duration_seconds
-        new_vehicles_count = np.random.poisson(lam)
+        if type_ids is not None:
+            new_vehicles_count = len(type_ids)
+        elif arrivals is None:
+            lam = (self.arrival_rate / 60.0) * duration_seconds
+            new_vehicles_count = int(self.rng.poisson(lam))
+        else:
+            new_vehicles_count = arrivals
         
         new_vehicle_types = []
         if new_vehicles_count > 0:
-            types = list(self.vehicle_probs.keys())
-            probs = list(self.vehicle_probs.values())
-            # Normalize probs just in case
-            prob_sum = sum(probs)
-            probs = [p/prob_sum for p in probs]
-            
-            new_vehicle_types = np.random.choice(types, size=new_vehicles_count, p=probs).tolist()
+            if type_ids is None:
+                type_ids = self.draw_type_ids(new_vehicles_count)
+            new_vehicle_types = self._type_name_arr[type_ids].tolist()
             
             # Add to Queue
-            for v_type in new_vehicle_types:
-                self.queue.append({
-                    "type": v_type,
-                    "arrival_time": self.sim_time
-                })
+            self._enqueue(type_ids, self.sim_time)
         
         return {
             "lane_id": self.lane_id,
             "new_arrivals": new_vehicles_count,
-            "queue_length": len(self.queue),
+            "queue_length": self.queue_length,
             "new_types": new_vehicle_types
         }
 
@@ -89,32 +140,23 @@ class TrafficSimulator:
         Simulate traffic flowing out based on vehicle types.
         Returns detailed stats.
         """
-        time_remaining = green_light_duration
-        discharged_count = 0
-        discharged_types = []
-        total_wait_time = 0.0
-        
-        # Process queue until time runs out or queue empty
-        while self.queue and time_remaining > 0:
-            next_vehicle = self.queue[0]
-            v_type = next_vehicle["type"]
-            cost = self.discharge_costs.get(v_type, 2.0)
-            
-            # Can this vehicle clear?
-            # We allow at least 1 vehicle if time > 0.5s to prevent lockups
-            if time_remaining >= cost or (discharged_count == 0 and time_remaining > 0.5):
-                # Discharge
-                v = self.queue.pop(0)
-                time_remaining -= cost
-                discharged_count += 1
-                discharged_types.append(v_type)
-                
-                # Stats
-                wait_time = self.sim_time - v["arrival_time"]
-                total_wait_time += wait_time
-            else:
-                break
-                
+        head = self._head
+        # No more than this many vehicles fit in the green time
+        max_count = min(self.queue_length,
+                        int(green_light_duration / self._discharge_costs_arr.min()) + 1)
+        
+        # A vehicle clears if the queue ahead of it plus its own cost fits
+        cumulative_costs = np.cumsum(self._discharge_costs_arr[self._types[head:head + max_count]])
+        discharged_count = int(np.searchsorted(cumulative_costs, green_light_duration, side='right'))
+        
+        # We allow at least 1 vehicle if time > 0.5s to prevent lockups
+        if discharged_count == 0 and green_light_duration > 0.5 and max_count > 0:
+            discharged_count = 1
+        
+        discharged = slice(head, head + discharged_count)
+        discharged_types = self._type_name_arr[self._types[discharged]].tolist()
+        total_wait_time = float((self.sim_time - self._arrivals[discharged]).sum())
+        self._head += discharged_count
         self.vehicles_passed += discharged_count
         
         return {
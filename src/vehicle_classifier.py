@@ -5,20 +5,109 @@ Uses VehicleNet-Y26x from Hugging Face for vehicle detection and classification
 
 import cv2
 import numpy as np
+from collections import Counter
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-import json
+from typing import List, Dict, Tuple, Optional, Iterator
+import multiprocessing
+import orjson
+import queue
+import shutil
+import subprocess
+import sys
+import threading
 from tqdm import tqdm
 
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; fall back to the NumPy version
+    njit = None
+
+
+# Structure-of-arrays record for one detection. 'frame' is the position of
+# the frame in VehicleClassifier.frame_detections; 'cls' indexes class_names
+DETECTION_DTYPE = np.dtype([
+    ('frame', 'i4'),
+    ('cls', 'i2'),
+    ('conf', 'f4'),
+    ('x1', 'f4'),
+    ('y1', 'f4'),
+    ('x2', 'f4'),
+    ('y2', 'f4')
+])
+
+if njit is not None:
+    @njit(cache=True)
+    def _map_boxes(boxes, inv_scale, left, top, roi, filter_roi):
+        """
+        Map model boxes to frame coordinates in one pass
+        
+        Returns:
+            (xyxy, keep mask of boxes centered in roi, bbox areas)
+        """
+        n = boxes.shape[0]
+        xyxy = np.empty((n, 4), dtype=np.float32)
+        keep = np.empty(n, dtype=np.bool_)
+        areas = np.empty(n, dtype=np.float32)
+        for i in range(n):
+            x1 = boxes[i, 0] * inv_scale + left
+            y1 = boxes[i, 1] * inv_scale + top
+            x2 = boxes[i, 2] * inv_scale + left
+            y2 = boxes[i, 3] * inv_scale + top
+            xyxy[i, 0], xyxy[i, 1], xyxy[i, 2], xyxy[i, 3] = x1, y1, x2, y2
+            cx = (x1 + x2) * 0.5
+            cy = (y1 + y2) * 0.5
+            keep[i] = not filter_roi or (roi[0] <= cx <= roi[2] and roi[1] <= cy <= roi[3])
+            areas[i] = (x2 - x1) * (y2 - y1)
+        return xyxy, keep, areas
+else:
+    def _map_boxes(boxes: np.ndarray, inv_scale: np.float32, left: np.float32, top: np.float32,
+                   roi: np.ndarray, filter_roi: bool) -> Tuple[np.ndarray, ...]:
+        """(xyxy, keep mask of boxes centered in roi, bbox areas) in frame coordinates"""
+        xyxy = boxes[:, :4] * inv_scale + np.array([left, top, left, top], dtype=np.float32)
+        cx = (xyxy[:, 0] + xyxy[:, 2]) * 0.5
+        cy = (xyxy[:, 1] + xyxy[:, 3]) * 0.5
+        keep = np.ones(len(xyxy), dtype=bool)
+        if filter_roi:
+            keep = (cx >= roi[0]) & (cx <= roi[2]) & (cy >= roi[1]) & (cy <= roi[3])
+        areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+        return xyxy, keep, areas
+
 
 class VehicleClassifier:
     """
     Vehicle classification pipeline using VehicleNet-Y26x YOLO model
     """
     
+    # Annotated video codecs: name -> (fourcc, container extension).
+    # 'nvenc' is encoded on the GPU through PyAV rather than cv2.VideoWriter
+    VIDEO_CODECS = {
+        'mp4v': ('mp4v', '.mp4'),
+        'mjpeg': ('MJPG', '.avi'),
+        'nvenc': ('avc1', '.mp4')
+    }
+    
+    PRECISIONS = ('fp32', 'fp16', 'int8')
+    
+    # Frame readers: OpenCV (plus an ffmpeg pipe for large skips) or PyAV
+    DECODERS = ('opencv', 'pyav')
+    
+    # Frame skip from which frames are read through an ffmpeg subprocess
+    FFMPEG_MIN_SKIP = 5
+    
+    # Largest batch a TensorRT engine is built for (engines use dynamic batch)
+    ENGINE_MAX_BATCH = 32
+    
+    # BGR colour of box labels in annotated video
+    LABEL_COLOR = np.array([0, 255, 0], dtype=np.uint16)
+    
     def __init__(self, model_name: str = "Perception365/VehicleNet-Y26s", 
                  confidence_threshold: float = 0.25,
-                 device: str = 'auto'):
+                 device: str = 'auto',
+                 precision: str = 'fp32',
+                 calibration_data: Optional[str] = None,
+                 imgsz: int = 640,
+                 tensorrt: bool = False):
         """
         Initialize the vehicle classifier
         
@@ -26,12 +115,37 @@ class VehicleClassifier:
             model_name: Hugging Face model identifier
             confidence_threshold: Minimum confidence for detections
             device: Device to run inference on ('auto', 'cpu', 'cuda')
+            precision: Inference precision ('fp32', 'fp16', 'int8').
+                       Reduced precision requires a CUDA device; int8 runs
+                       through an exported TensorRT engine.
+            calibration_data: Dataset YAML used to calibrate int8 export
+            imgsz: Inference size (longest side, pixels). Every frame of a
+                   batch is letterboxed to the same shape at this size.
+            tensorrt: Run through a TensorRT engine built at the chosen
+                      precision (CUDA only). Engines are cached next to the
+                      weights and reused on later runs.
         """
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"Unsupported precision: {precision}")
+        if precision == 'int8' and calibration_data is None:
+            raise ValueError("int8 precision requires calibration_data")
+        
         self.model_name = model_name
         self.confidence_threshold = confidence_threshold
         self.device = device
+        self.precision = precision
+        self.calibration_data = calibration_data
+        self.imgsz = imgsz
+        self.tensorrt = tensorrt or precision == 'int8'
         self.model = None
         self.frame_detections = []
+        self.detection_array = np.empty(0, dtype=DETECTION_DTYPE)
+        self.class_names = []
+        # Interned class names by class id, set by load_model
+        self._names = {}
+        self.annotated_video_path = None
+        # Rendered box labels keyed by label text, see _blit_label
+        self._label_sprites = {}
         
     def load_model(self):
         """Load the VehicleNet-Y26s model from Hugging Face"""
@@ -43,41 +157,66 @@ class VehicleClassifier:
             print(f"Loading model: {self.model_name}")
             print(f"Searching for weights in Hugging Face repo: {self.model_name}...")
             
-            try:
-                # 1. Try 'weights/best.pt' (standard structure for this repo)
-                print(f"Downloading weights/best.pt...")
-                model_path = hf_hub_download(
-                    repo_id=self.model_name,
-                    filename="weights/best.pt"
-                )
-            except Exception:
-                # 2. Search for any .pt file if specific path fails
-                print("Specific 'weights/best.pt' not found, searching repo...")
-                files = list_repo_files(repo_id=self.model_name)
-                pt_files = [f for f in files if f.endswith('.pt')]
+            # Weights from an earlier run are reused without a network round-trip
+            model_path = self._cached_weights()
+            if model_path is not None:
+                print(f"✓ Using cached weights: {model_path}")
+            else:
+                try:
+                    # 1. Try 'weights/best.pt' (standard structure for this repo)
+                    print(f"Downloading weights/best.pt...")
+                    model_path = hf_hub_download(
+                        repo_id=self.model_name,
+                        filename="weights/best.pt"
+                    )
+                except Exception:
+                    # 2. Search for any .pt file if specific path fails
+                    print("Specific 'weights/best.pt' not found, searching repo...")
+                    files = list_repo_files(repo_id=self.model_name)
+                    pt_files = [f for f in files if f.endswith('.pt')]
                 
-                if not pt_files:
-                    raise FileNotFoundError("No .pt weights found in repository")
+                    if not pt_files:
+                        raise FileNotFoundError("No .pt weights found in repository")
                 
-                # Pick the best candidate
-                if 'best.pt' in pt_files:
-                    weight_file = 'best.pt'
-                elif 'model.pt' in pt_files:
-                    weight_file = 'model.pt'
-                else:
-                    weight_file = pt_files[0] 
+                    # Pick the best candidate
+                    if 'best.pt' in pt_files:
+                        weight_file = 'best.pt'
+                    elif 'model.pt' in pt_files:
+                        weight_file = 'model.pt'
+                    else:
+                        weight_file = pt_files[0] 
                 
-                print(f"Found alternative weight file: {weight_file}")
-                model_path = hf_hub_download(
-                    repo_id=self.model_name,
-                    filename=weight_file
-                )
+                    print(f"Found alternative weight file: {weight_file}")
+                    model_path = hf_hub_download(
+                        repo_id=self.model_name,
+                        filename=weight_file
+                    )
 
-            print(f"✓ Downloaded to: {model_path}")
+                print(f"✓ Downloaded to: {model_path}")
             
             # Load with YOLO
             self.model = YOLO(model_path)
-            print(f"✓ Model loaded successfully")
+            
+            if self.device == 'auto':
+                import torch
+                self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            
+            if self.precision != 'fp32' and self.device == 'cpu':
+                print(f"⚠ {self.precision} inference needs a CUDA device, using fp32")
+                self.precision = 'fp32'
+            if self.tensorrt and self.device == 'cpu':
+                print("⚠ TensorRT needs a CUDA device, using PyTorch")
+                self.tensorrt = False
+            
+            if self.tensorrt:
+                self.model = YOLO(self._engine_path(model_path), task='detect')
+            
+            # Every detection of a class shares one interned name string
+            self._names = {k: sys.intern(v) for k, v in self.model.names.items()}
+            
+            backend = 'TensorRT' if self.tensorrt else 'PyTorch'
+            print(f"✓ Model loaded successfully (device: {self.device}, "
+                  f"precision: {self.precision}, backend: {backend})")
             return True
                 
         except Exception as e:
@@ -91,35 +230,128 @@ class VehicleClassifier:
             print("3. Check internet connection")
             return False
     
+    def _engine_path(self, model_path: str) -> str:
+        """
+        Return a TensorRT engine for the loaded weights, exporting it once
+        
+        Engines depend on precision and input size, so each combination is
+        cached under its own name next to the weights.
+        
+        Args:
+            model_path: Path to the .pt weights
+            
+        Returns:
+            Path to the .engine file
+        """
+        weights = Path(model_path)
+        engine_path = weights.with_name(f"{weights.stem}-{self.precision}-{self.imgsz}.engine")
+        if engine_path.exists():
+            print(f"✓ Using cached TensorRT engine: {engine_path}")
+            return str(engine_path)
+        
+        print(f"Exporting {self.precision} TensorRT engine (one-time)...")
+        exported = self.model.export(format='engine',
+                                     half=self.precision == 'fp16',
+                                     int8=self.precision == 'int8',
+                                     data=self.calibration_data,
+                                     imgsz=self.imgsz,
+                                     dynamic=True,
+                                     batch=self.ENGINE_MAX_BATCH,
+                                     workspace=4,
+                                     device=self.device)
+        shutil.move(exported, engine_path)
+        return str(engine_path)
+    
+    def _cached_weights(self) -> Optional[str]:
+        """
+        Find model weights in the local Hugging Face cache
+        
+        Returns:
+            Path to the cached .pt file, or None if the repo has not been
+            downloaded yet
+        """
+        from huggingface_hub import snapshot_download
+        
+        try:
+            snapshot = Path(snapshot_download(repo_id=self.model_name,
+                                              allow_patterns='*.pt',
+                                              local_files_only=True))
+        except Exception:
+            return None
+        
+        pt_files = {p.relative_to(snapshot).as_posix(): p for p in snapshot.rglob('*.pt')}
+        if not pt_files:
+            return None
+        
+        # Same preference order as the download in load_model
+        for name in ('weights/best.pt', 'best.pt', 'model.pt'):
+            if name in pt_files:
+                return str(pt_files[name])
+        return str(pt_files[sorted(pt_files)[0]])
+    
     def process_video(self, 
                      video_path: str, 
                      output_dir: str,
                      roi: Optional[Tuple[int, int, int, int]] = None,
-                     save_annotated: bool = True,
-                     frame_skip: int = 1) -> List[Dict]:
+                     save_annotated: bool = False,
+                     frame_skip: int = 1,
+                     codec: str = 'mp4v',
+                     hw_decode: bool = False,
+                     decoder: str = 'opencv',
+                     batch_size: int = 8,
+                     workers: int = 1) -> List[Dict]:
         """
         Process video and extract vehicle detections
         
         Args:
             video_path: Path to input video file
             output_dir: Directory to save outputs
-            roi: Region of Interest as (x1, y1, x2, y2). None = full frame
-            save_annotated: Whether to save annotated video
+            roi: Region of Interest as (x1, y1, x2, y2). None = full frame.
+                 Only this region is passed to the model, so vehicles that
+                 cross its edge are seen as clipped boxes.
+            save_annotated: Whether to save annotated video. Off by default,
+                            since encoding often costs more than detection
             frame_skip: Process every Nth frame (1 = all frames)
+            codec: Codec for the annotated video ('mp4v', 'mjpeg' or 'nvenc').
+                   MJPEG encodes every frame as a keyframe, so it is cheaper
+                   to write and to seek in afterwards. NVENC encodes H.264 on
+                   the GPU (needs PyAV) and falls back to mp4v.
+            hw_decode: Decode with FFmpeg hardware acceleration (NVDEC,
+                       VA-API, ...) when the OpenCV build supports it
+            decoder: Frame reader, 'opencv' or 'pyav'. PyAV decodes with
+                     threaded FFmpeg (on the GPU with hw_decode) and converts
+                     only the kept frames to BGR. Workers always use OpenCV.
+            batch_size: Number of frames sent to the model per forward pass
+            workers: Number of processes that each run the model on a
+                     contiguous chunk of the video (annotated video is not
+                     written when workers > 1)
             
         Returns:
             List of detection dictionaries per frame
         """
         if self.model is None:
             raise ValueError("Model not loaded. Call load_model() first.")
+        if codec not in self.VIDEO_CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+        if decoder not in self.DECODERS:
+            raise ValueError(f"Unsupported decoder: {decoder}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if self.tensorrt and batch_size > self.ENGINE_MAX_BATCH:
+            raise ValueError(f"batch_size is limited to {self.ENGINE_MAX_BATCH} with TensorRT")
+        if workers > 1 and save_annotated:
+            print("⚠ Annotated video is not written when using multiple workers")
+            save_annotated = False
         
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
-        # Open video
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"Cannot open video: {video_path}")
+        # Open video. PyAV does its own decoding, so the capture is then only
+        # used for metadata and is opened without hardware acceleration
+        pyav = decoder == 'pyav' and workers == 1
+        cap = self._open_capture(video_path, hw_decode and not pyav)
         
         # Get video properties
         fps = int(cap.get(cv2.CAP_PROP_FPS))
@@ -136,122 +368,584 @@ class VehicleClassifier:
         # Setup video writer if saving annotated output
         writer = None
         if save_annotated:
-            output_video = output_path / "annotated_video.mp4"
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            writer = cv2.VideoWriter(str(output_video), fourcc, fps, (width, height))
+            if codec == 'nvenc':
+                writer = _NvencWriter.open(str(output_path / "annotated_video.mp4"),
+                                           fps, (width, height))
+                if writer is None:
+                    print("⚠ NVENC encoding unavailable, using mp4v")
+                    codec = 'mp4v'
+            fourcc_code, extension = self.VIDEO_CODECS[codec]
+            output_video = output_path / f"annotated_video{extension}"
+            if writer is None:
+                fourcc = cv2.VideoWriter_fourcc(*fourcc_code)
+                writer = cv2.VideoWriter(str(output_video), fourcc, fps, (width, height))
         
         # Calculate ROI area
         if roi is None:
             roi = (0, 0, width, height)
         roi_area = (roi[2] - roi[0]) * (roi[3] - roi[1])
         
-        # Process frames
+        # Process frames; detections are written out one frame per line
+        self._reset_detections()
+        detections_file = output_path / "detections.jsonl"
+        with open(detections_file, 'wb') as detections_fh:
+            if workers > 1:
+                cap.release()
+                self._process_parallel(video_path, fps, total_frames, frame_skip, workers,
+                                       roi, roi_area, batch_size, hw_decode)
+                self._write_detection_lines(self.frame_detections, detections_fh)
+            else:
+                draw_roi = roi != (0, 0, width, height)
+                
+                # Decode into reusable frame buffers instead of allocating a
+                # frame per iteration; annotations are drawn into them in place
+                batch_buffer = np.empty((self._pipeline_frames(batch_size), height, width, 3),
+                                        dtype=np.uint8)
+                
+                frames = None
+                if pyav:
+                    frames = self._pyav_frames(video_path, frame_skip, hw_decode)
+                    if frames is None and hw_decode:
+                        # Falling back to OpenCV; reopen it with acceleration
+                        cap.release()
+                        cap = self._open_capture(video_path, hw_decode)
+                
+                if frames is not None:
+                    cap.release()
+                # For large skips let ffmpeg drop frames before they reach the decoder
+                elif frame_skip >= self.FFMPEG_MIN_SKIP and shutil.which('ffmpeg'):
+                    cap.release()
+                    frames = self._ffmpeg_frames(video_path, frame_skip, batch_buffer, hw_decode)
+                else:
+                    frames = self._capture_frames(cap, frame_skip, batch_buffer)
+                
+                pbar = tqdm(total=total_frames, desc="Processing video")
+                self._run_frames(frames, fps, batch_size, roi, roi_area, writer, draw_roi, pbar,
+                                 detections_fh)
+                pbar.close()
+                
+                cap.release()
+        if writer:
+            writer.release()
+        
+        self.detection_array = self._collect_detection_array()
+        self._attach_frame_arrays()
+        processed_count = len(self.frame_detections)
+        
+        print(f"\n✓ Processed {processed_count} frames")
+        print(f"✓ Total detections: {sum(len(f['detections']) for f in self.frame_detections)}")
+        print(f"✓ Detections saved to: {detections_file}")
+        
+        if save_annotated:
+            self.annotated_video_path = output_video
+            print(f"✓ Annotated video saved to: {output_video}")
+        
+        return self.frame_detections
+    
+    def _reset_detections(self):
+        """Clear accumulated detections before processing a video"""
         self.frame_detections = []
-        frame_idx = 0
-        processed_count = 0
+        self._detection_chunks = []
+        self.class_names = [self._names[i] for i in sorted(self._names)]
+    
+    def _collect_detection_array(self) -> np.ndarray:
+        """Concatenate per-batch detection records into one array"""
+        chunks, self._detection_chunks = self._detection_chunks, []
+        if not chunks:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        return np.concatenate(chunks)
+    
+    def _attach_frame_arrays(self):
+        """
+        Give each frame_data dict its detections as arrays
+        
+        'class_ids' (int16, indexes class_names) and 'bbox_areas' (float32)
+        are views into detection_array, so no per-frame copies are made.
+        They are added after detections.jsonl is written and are not part of it.
+        """
+        det = self.detection_array
+        bbox_areas = (det['x2'] - det['x1']) * (det['y2'] - det['y1'])
+        offsets = np.searchsorted(det['frame'], np.arange(len(self.frame_detections) + 1))
+        for i, frame_data in enumerate(self.frame_detections):
+            start, end = offsets[i], offsets[i + 1]
+            frame_data['class_ids'] = det['cls'][start:end]
+            frame_data['bbox_areas'] = bbox_areas[start:end]
+    
+    @staticmethod
+    def _pipeline_frames(batch_size: int) -> int:
+        """
+        Number of frame buffers needed by _run_frames
         
-        pbar = tqdm(total=total_frames, desc="Processing video")
+        The reader fills one batch while another waits in the read queue,
+        one is being detected, one waits in the write queue and one is
+        being written, so buffer slots are not reused while a later stage
+        still needs them.
+        """
+        return 5 * batch_size
+    
+    def _run_frames(self, frames: Iterator[Tuple[int, np.ndarray]], fps: float,
+                    batch_size: int, roi: Tuple[int, int, int, int], roi_area: int,
+                    writer: Optional[cv2.VideoWriter], draw_roi: bool,
+                    pbar: Optional[tqdm] = None, detections_fh=None):
+        """
+        Batch frames from a frame reader and run detection on each batch
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Skip frames if needed
-            if frame_idx % frame_skip != 0:
-                frame_idx += 1
-                pbar.update(1)
-                continue
-            
-            # Calculate timestamp
-            timestamp = frame_idx / fps
-            
-            # Run inference
-            results = self.model(frame, conf=self.confidence_threshold, verbose=False)
-            
-            # Extract detections
-            frame_data = {
+        Decoding, detection and annotation/writing run on separate threads
+        joined by bounded queues, so the model is not left waiting while
+        frames are decoded or encoded. A frame reader that reuses buffers
+        needs _pipeline_frames(batch_size) of them. If detections_fh is
+        given, each frame's detections are written to it as a JSON line.
+        
+        The reader thread also prepares model inputs (see _prepare_batch),
+        so a batch is cropped and resized while the previous one is detected.
+        """
+        read_q = queue.Queue(maxsize=1)
+        write_q = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        errors = []
+        
+        def put(q, item) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+        
+        def read():
+            try:
+                batch = []  # (frame_idx, timestamp, frame)
+                for frame_idx, frame in frames:
+                    batch.append((frame_idx, frame_idx / fps, frame))
+                    if len(batch) == batch_size:
+                        if not put(read_q, (batch, self._prepare_batch(batch, roi))):
+                            break
+                        batch = []
+                else:
+                    if batch:
+                        put(read_q, (batch, self._prepare_batch(batch, roi)))
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                if hasattr(frames, 'close'):
+                    frames.close()
+                put(read_q, None)
+        
+        def write():
+            try:
+                while (item := get(write_q)) is not None:
+                    batch, frame_datas = item
+                    if writer is not None:
+                        self._write_batch(batch, frame_datas, roi, writer, draw_roi)
+                    if detections_fh is not None:
+                        self._write_detection_lines(frame_datas, detections_fh)
+                    if pbar is not None:
+                        pbar.update(batch[-1][0] + 1 - pbar.n)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+        
+        threads = [threading.Thread(target=read, daemon=True),
+                   threading.Thread(target=write, daemon=True)]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            while (item := get(read_q)) is not None:
+                batch, prepared = item
+                if not put(write_q, (batch, self._process_batch(batch, prepared, roi, roi_area))):
+                    break
+            put(write_q, None)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+        
+        if errors:
+            raise errors[0]
+    
+    def _process_parallel(self, video_path: str, fps: float, total_frames: int,
+                          frame_skip: int, workers: int,
+                          roi: Tuple[int, int, int, int], roi_area: int,
+                          batch_size: int, hw_decode: bool):
+        """Split the video into contiguous frame ranges and detect in a process pool"""
+        # Chunk boundaries fall on multiples of frame_skip so the same frames
+        # are kept as in a sequential run; the last chunk reads to the end
+        kept_frames = -(-total_frames // frame_skip)
+        chunk_len = max(-(-kept_frames // workers), 1) * frame_skip
+        starts = [i * chunk_len for i in range(workers) if i * chunk_len < total_frames] or [0]
+        ends = starts[1:] + [None]
+        
+        # One worker per GPU when running on CUDA, round-robin if oversubscribed
+        devices = [self.device] * len(starts)
+        if str(self.device).startswith('cuda'):
+            import torch
+            n_gpus = max(torch.cuda.device_count(), 1)
+            devices = [f'cuda:{i % n_gpus}' for i in range(len(starts))]
+        
+        jobs = [{
+            'classifier': {
+                'model_name': self.model_name,
+                'confidence_threshold': self.confidence_threshold,
+                'device': device,
+                'precision': self.precision,
+                'calibration_data': self.calibration_data,
+                'imgsz': self.imgsz,
+                'tensorrt': self.tensorrt
+            },
+            'video_path': video_path,
+            'start_frame': start,
+            'end_frame': end,
+            'fps': fps,
+            'frame_skip': frame_skip,
+            'roi': roi,
+            'roi_area': roi_area,
+            'batch_size': batch_size,
+            'hw_decode': hw_decode
+        } for start, end, device in zip(starts, ends, devices)]
+        
+        print(f"Processing {len(jobs)} chunks with {len(jobs)} workers...")
+        with multiprocessing.get_context('spawn').Pool(len(jobs)) as pool:
+            results = pool.map(_process_chunk, jobs)
+        
+        # Merge in video order, re-basing each chunk's frame positions
+        for frame_detections, detection_array in results:
+            detection_array['frame'] += len(self.frame_detections)
+            self.frame_detections.extend(frame_detections)
+            if len(detection_array):
+                self._detection_chunks.append(detection_array)
+    
+    def _prepare_batch(self, batch: List[Tuple[int, float, np.ndarray]],
+                       roi: Tuple[int, int, int, int]) -> Dict:
+        """
+        Build the model inputs for a batch of frames
+        
+        Only the ROI is sent to the model, and crops larger than the
+        inference size are shrunk here so only imgsz-sized images are
+        uploaded and letterboxed.
+        
+        Returns:
+            Dict with 'inputs' (image list), 'scale', 'offset' (ROI
+            top-left) and 'cropped'
+        """
+        h, w = batch[0][2].shape[:2]
+        left, top = max(roi[0], 0), max(roi[1], 0)
+        right, bottom = min(roi[2], w), min(roi[3], h)
+        cropped = (left, top, right, bottom) != (0, 0, w, h)
+        inputs = [frame[top:bottom, left:right] if cropped else frame for _, _, frame in batch]
+        
+        scale = min(self.imgsz / max(right - left, bottom - top), 1.0)
+        if scale < 1.0:
+            size = (round((right - left) * scale), round((bottom - top) * scale))
+            inputs = [cv2.resize(image, size, interpolation=cv2.INTER_LINEAR) for image in inputs]
+        
+        return {'inputs': inputs, 'scale': scale, 'offset': (left, top), 'cropped': cropped}
+    
+    def _process_batch(self, batch: List[Tuple[int, float, np.ndarray]], prepared: Dict,
+                       roi: Tuple[int, int, int, int], roi_area: int) -> List[Dict]:
+        """Run one forward pass over a prepared batch and collect detections"""
+        inputs, scale = prepared['inputs'], prepared['scale']
+        left, top = prepared['offset']
+        
+        results = self.model(inputs,
+                             conf=self.confidence_threshold,
+                             device=self.device,
+                             half=self.precision == 'fp16',
+                             imgsz=self.imgsz,
+                             verbose=False)
+        chunks = []  # DETECTION_DTYPE records for this batch
+        # Filled by position and added to frame_detections in one extend
+        frame_datas = [None] * len(batch)
+        first_pos = len(self.frame_detections)
+        
+        # One device-to-host copy for the whole batch. Rows are
+        # (x1, y1, x2, y2, conf, cls); frame i owns rows offsets[i]:offsets[i + 1]
+        import torch
+        boxes = torch.cat([result.boxes.data for result in results]).float().cpu().numpy()
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum([len(result.boxes) for result in results], out=offsets[1:])
+        
+        # Boxes found in a crop always lie within the ROI; full frames keep
+        # boxes centered in it. Frame i keeps rows kept[i]:kept[i + 1]
+        xyxy, keep, bbox_areas = _map_boxes(
+            boxes, np.float32(1 / scale), np.float32(left), np.float32(top),
+            np.array(roi, dtype=np.float64), not prepared['cropped'])
+        kept = np.concatenate(([0], np.cumsum(keep)))[offsets]
+        xyxy, bbox_areas = xyxy[keep], bbox_areas[keep]
+        cls_ids = boxes[keep, -1].astype(np.int16)
+        confs = boxes[keep, -2]
+        
+        if len(cls_ids):
+            records = np.empty(len(cls_ids), dtype=DETECTION_DTYPE)
+            records['frame'] = np.repeat(np.arange(first_pos, first_pos + len(batch)), np.diff(kept))
+            records['cls'] = cls_ids
+            records['conf'] = confs
+            for col, field in enumerate(('x1', 'y1', 'x2', 'y2')):
+                records[field] = xyxy[:, col]
+            chunks.append(records)
+        
+        # Python values for the detection dicts, converted once per batch
+        names = self._names
+        cls_list, conf_list = cls_ids.tolist(), confs.tolist()
+        bbox_list, area_list = xyxy.tolist(), bbox_areas.tolist()
+        
+        for i, (frame_idx, timestamp, _) in enumerate(batch):
+            start, end = kept[i], kept[i + 1]
+            frame_datas[i] = {
                 'frame_idx': frame_idx,
                 'timestamp': timestamp,
-                'detections': [],
-                'roi_area': roi_area
-            }
-            
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    # Get bounding box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    # Check if detection is within ROI
-                    if not self._is_in_roi(x1, y1, x2, y2, roi):
-                        continue
-                    
-                    # Get class and confidence
-                    cls_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    class_name = result.names[cls_id]
-                    
-                    # Calculate bounding box area
-                    bbox_area = (x2 - x1) * (y2 - y1)
-                    
-                    detection = {
-                        'class': class_name,
+                'detections': [
+                    {
+                        'class': names[cls_id],
                         'confidence': confidence,
-                        'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                        'bbox_area': float(bbox_area)
+                        'bbox': bbox,
+                        'bbox_area': bbox_area
                     }
-                    
-                    frame_data['detections'].append(detection)
-                    
-                    # Draw on frame if saving
-                    if save_annotated:
-                        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), 
-                                    (0, 255, 0), 2)
-                        label = f"{class_name}: {confidence:.2f}"
-                        cv2.putText(frame, label, (int(x1), int(y1)-10),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                    for cls_id, confidence, bbox, bbox_area in zip(
+                        cls_list[start:end], conf_list[start:end],
+                        bbox_list[start:end], area_list[start:end])
+                ],
+                'roi_area': roi_area
+            }
+        
+        self.frame_detections.extend(frame_datas)
+        self._detection_chunks.extend(chunks)
+        return frame_datas
+    
+    def _write_batch(self, batch: List[Tuple[int, float, np.ndarray]], frame_datas: List[Dict],
+                     roi: Tuple[int, int, int, int], writer: cv2.VideoWriter, draw_roi: bool):
+        """Annotate a detected batch of frames in place and write them out"""
+        # Box corners and label strings for the whole batch, built in one
+        # pass; frame i owns entries offsets[i]:offsets[i + 1]
+        detections = [d for frame_data in frame_datas for d in frame_data['detections']]
+        boxes = np.array([d['bbox'] for d in detections]).reshape(-1, 4).astype(np.int32)
+        labels = [f"{d['class']}: {d['confidence']:.2f}" for d in detections]
+        offsets = np.zeros(len(frame_datas) + 1, dtype=np.int64)
+        np.cumsum([len(frame_data['detections']) for frame_data in frame_datas], out=offsets[1:])
+        
+        for i, (frame_idx, timestamp, frame) in enumerate(batch):
+            start, end = offsets[i], offsets[i + 1]
+            self._draw_detections(frame, boxes[start:end], labels[start:end])
             
             # Draw ROI rectangle
-            if save_annotated and roi != (0, 0, width, height):
+            if draw_roi:
                 cv2.rectangle(frame, (roi[0], roi[1]), (roi[2], roi[3]), 
                             (255, 0, 0), 2)
             
-            # Add frame info
-            if save_annotated:
-                info_text = f"Frame: {frame_idx} | Time: {timestamp:.2f}s | Vehicles: {len(frame_data['detections'])}"
-                cv2.putText(frame, info_text, (10, 30),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                writer.write(frame)
-            
-            self.frame_detections.append(frame_data)
-            
+            # Add frame info. Frame index and time change every frame, so the
+            # banner cannot be cached like the box labels
+            info_text = f"Frame: {frame_idx} | Time: {timestamp:.2f}s | Vehicles: {end - start}"
+            cv2.putText(frame, info_text, (10, 30),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            writer.write(frame)
+    
+    @staticmethod
+    def _write_detection_lines(frame_datas: List[Dict], fh):
+        """Append frames to a binary file as JSON Lines"""
+        # Frames are written before _attach_frame_arrays adds their array
+        # views, so each dict is serialized as is
+        fh.write(b''.join(orjson.dumps(frame, option=orjson.OPT_APPEND_NEWLINE)
+                          for frame in frame_datas))
+    
+    def _draw_detections(self, frame: np.ndarray, boxes: np.ndarray, labels: List[str]):
+        """Draw all boxes (K, 4 int32) of a frame in one call and blit their cached labels"""
+        if not len(boxes):
+            return
+        
+        # Corners of each box as a closed polygon: (K, 4, 2)
+        corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(frame, list(corners), True, (0, 255, 0), 2)
+        
+        for label, x1, y1 in zip(labels, boxes[:, 0].tolist(), boxes[:, 1].tolist()):
+            self._blit_label(frame, label, x1, y1 - 10)
+    
+    def _blit_label(self, frame: np.ndarray, label: str, x: int, y: int):
+        """Copy a pre-rendered label onto frame with its baseline origin at (x, y)"""
+        sprite = self._label_sprites.get(label)
+        if sprite is None:
+            (w, h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+            pad = 2
+            # Text coverage (0-255) is rendered once and reused as a blend mask
+            alpha = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+            cv2.putText(alpha, label, (pad, pad + h),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, 255, 2)
+            sprite = (alpha.astype(np.uint16)[..., None], pad + h, pad)
+            self._label_sprites[label] = sprite
+        
+        alpha, dy, dx = sprite
+        top, left = y - dy, x - dx
+        # Clip the sprite to the frame
+        y0, x0 = max(top, 0), max(left, 0)
+        y1 = min(top + alpha.shape[0], frame.shape[0])
+        x1 = min(left + alpha.shape[1], frame.shape[1])
+        if y0 >= y1 or x0 >= x1:
+            return
+        a = alpha[y0 - top:y1 - top, x0 - left:x1 - left]
+        region = frame[y0:y1, x0:x1]
+        region[:] = (region * (255 - a) + self.LABEL_COLOR * a + 127) // 255
+    
+    def _capture_frames(self, cap: cv2.VideoCapture, frame_skip: int,
+                        buffers: np.ndarray, start_frame: int = 0,
+                        end_frame: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_idx, frame) for every Nth frame, decoding into buffer slots"""
+        frame_idx = start_frame
+        slot = 0
+        # grab() only demuxes; skipped frames never pay for the decode
+        while (end_frame is None or frame_idx < end_frame) and cap.grab():
+            if frame_idx % frame_skip == 0:
+                ret, frame = cap.retrieve(buffers[slot])
+                if not ret:
+                    break
+                yield frame_idx, frame
+                slot = (slot + 1) % len(buffers)
             frame_idx += 1
-            processed_count += 1
-            pbar.update(1)
+    
+    def _ffmpeg_frames(self, video_path: str, frame_skip: int, buffers: np.ndarray,
+                       hw_decode: bool = False) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yield (frame_idx, frame) for every Nth frame using an ffmpeg subprocess
         
-        pbar.close()
-        cap.release()
-        if writer:
-            writer.release()
+        The select filter drops frames inside ffmpeg, so only retained frames
+        are converted to BGR and piped back as raw video.
+        """
+        cmd = ['ffmpeg', '-loglevel', 'error', '-nostdin']
+        if hw_decode:
+            cmd += ['-hwaccel', 'auto']
+        cmd += ['-i', video_path,
+                '-vf', f'select=not(mod(n\\,{frame_skip}))', '-vsync', 'vfr',
+                '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
         
-        print(f"\n✓ Processed {processed_count} frames")
-        print(f"✓ Total detections: {sum(len(f['detections']) for f in self.frame_detections)}")
+        # ffmpeg's error messages go straight to the terminal
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=buffers[0].nbytes)
+        try:
+            frame_idx = 0
+            slot = 0
+            while self._read_exact(proc.stdout, buffers[slot]):
+                yield frame_idx, buffers[slot]
+                frame_idx += frame_skip
+                slot = (slot + 1) % len(buffers)
+            
+            # The stream ended; a failed decode must not pass as a short video
+            returncode = proc.wait()
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with code {returncode} "
+                                   f"after {frame_idx // frame_skip} frames of {video_path}")
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                # The consumer stopped early
+                proc.kill()
+            proc.wait()
+    
+    def _pyav_frames(self, video_path: str, frame_skip: int,
+                     hw_decode: bool = False) -> Optional[Iterator[Tuple[int, np.ndarray]]]:
+        """
+        Yield (frame_idx, frame) for every Nth frame decoded with PyAV
         
-        # Save detections to JSON
-        detections_file = output_path / "detections.json"
-        with open(detections_file, 'w') as f:
-            json.dump(self.frame_detections, f, indent=2)
-        print(f"✓ Detections saved to: {detections_file}")
+        Every frame still goes through the decoder, but skipped frames are
+        never converted to BGR or copied out of FFmpeg. With hw_decode, NVDEC
+        is only reported once the first frame has decoded on the GPU.
         
-        if save_annotated:
-            print(f"✓ Annotated video saved to: {output_video}")
+        Returns:
+            Frame iterator, or None if PyAV is not installed
+        """
+        try:
+            import av
+        except ImportError:
+            print("⚠ PyAV not installed (pip install av), using OpenCV decoder")
+            return None
         
-        return self.frame_detections
+        def open_decoder(hwaccel=None):
+            container = av.open(video_path, hwaccel=hwaccel)
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            return container, stream, container.decode(stream)
+        
+        opened = None
+        if hw_decode:
+            from av.codec.hwaccel import HWAccel
+            # Without a silent software fallback, a missing GPU or an
+            # unsupported codec fails here instead of decoding on the CPU
+            container = None
+            try:
+                container, stream, decoded = open_decoder(
+                    HWAccel(device_type='cuda', allow_software_fallback=False))
+                first = next(decoded, None)
+                if stream.codec_context.is_hwaccel:
+                    opened = container, decoded, first
+                    print("✓ Hardware video decoding enabled (NVDEC)")
+            except av.FFmpegError:
+                pass
+            if opened is None:
+                if container is not None:
+                    container.close()
+                print("⚠ Hardware decoding unavailable, using software decoder")
+        if opened is None:
+            container, _, decoded = open_decoder()
+            opened = container, decoded, next(decoded, None)
+        
+        def frames(container, decoded, first):
+            try:
+                if first is None:
+                    return
+                for frame_idx, frame in enumerate(chain([first], decoded)):
+                    if frame_idx % frame_skip == 0:
+                        yield frame_idx, frame.to_ndarray(format='bgr24')
+            finally:
+                container.close()
+        
+        return frames(*opened)
+    
+    @staticmethod
+    def _read_exact(stream, out: np.ndarray) -> bool:
+        """Fill out from a byte stream; False if the stream ends first"""
+        view = memoryview(out).cast('B')
+        filled = 0
+        while filled < len(view):
+            n = stream.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+    
+    def _open_capture(self, video_path: str, hw_decode: bool = False) -> cv2.VideoCapture:
+        """Open a video capture, requesting hardware decoding if asked"""
+        if hw_decode:
+            cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+            if cap.isOpened():
+                if int(cap.get(cv2.CAP_PROP_HW_ACCELERATION)) != cv2.VIDEO_ACCELERATION_NONE:
+                    print("✓ Hardware video decoding enabled")
+                else:
+                    print("⚠ Hardware decoding unavailable, using software decoder")
+                return cap
+            print("⚠ Hardware decoding failed to open video, using software decoder")
+        
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_path}")
+        return cap
     
     def _is_in_roi(self, x1: float, y1: float, x2: float, y2: float, 
                    roi: Tuple[int, int, int, int]) -> bool:
-        """Check if bounding box center is within ROI"""
+        """
+        Check if bounding box center is within ROI
+        
+        Kept for callers outside the pipeline; _prepare_batch crops frames
+        to the ROI before detection instead.
+        """
         center_x = (x1 + x2) / 2
         center_y = (y1 + y2) / 2
         return (roi[0] <= center_x <= roi[2] and roi[1] <= center_y <= roi[3])
@@ -261,20 +955,79 @@ class VehicleClassifier:
         if not self.frame_detections:
             return {}
         
-        total_detections = sum(len(f['detections']) for f in self.frame_detections)
-        
-        # Count by class
-        class_counts = {}
-        for frame in self.frame_detections:
-            for det in frame['detections']:
-                cls = det['class']
-                class_counts[cls] = class_counts.get(cls, 0) + 1
+        # Count by class (in order of first appearance)
+        class_counts = Counter(det['class'] for frame in self.frame_detections
+                               for det in frame['detections'])
+        total_detections = sum(class_counts.values())
         
         summary = {
             'total_frames': len(self.frame_detections),
             'total_detections': total_detections,
             'avg_detections_per_frame': total_detections / len(self.frame_detections),
-            'class_distribution': class_counts
+            'class_distribution': dict(class_counts)
         }
         
         return summary
+
+
+class _NvencWriter:
+    """cv2.VideoWriter stand-in that encodes H.264 on the GPU through PyAV"""
+    
+    def __init__(self, container, stream):
+        self._container = container
+        self._stream = stream
+    
+    @classmethod
+    def open(cls, path: str, fps: float, size: Tuple[int, int]) -> Optional['_NvencWriter']:
+        """
+        Open an h264_nvenc stream, or return None if PyAV or NVENC is missing
+        """
+        try:
+            import av
+        except ImportError:
+            return None
+        
+        container = av.open(path, 'w')
+        try:
+            stream = container.add_stream('h264_nvenc', rate=fps)
+            stream.width, stream.height = size
+            stream.pix_fmt = 'yuv420p'
+            stream.codec_context.open()  # Fails here without an NVENC device
+        except (av.FFmpegError, ValueError):
+            container.close()
+            return None
+        return cls(container, stream)
+    
+    def write(self, frame: np.ndarray):
+        import av
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        self._container.mux(self._stream.encode(video_frame))
+    
+    def release(self):
+        self._container.mux(self._stream.encode())  # Flush buffered frames
+        self._container.close()
+
+
+def _process_chunk(job: Dict) -> Tuple[List[Dict], np.ndarray]:
+    """Pool worker: detect vehicles in one frame range of a video"""
+    classifier = VehicleClassifier(**job['classifier'])
+    if not classifier.load_model():
+        raise RuntimeError(f"Worker could not load model {classifier.model_name}")
+    
+    cap = classifier._open_capture(job['video_path'], job['hw_decode'])
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if job['start_frame']:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, job['start_frame'])
+    
+    buffers = np.empty((classifier._pipeline_frames(job['batch_size']), height, width, 3),
+                       dtype=np.uint8)
+    frames = classifier._capture_frames(cap, job['frame_skip'], buffers,
+                                        job['start_frame'], job['end_frame'])
+    
+    classifier._reset_detections()
+    classifier._run_frames(frames, job['fps'], job['batch_size'],
+                           job['roi'], job['roi_area'], None, False)
+    cap.release()
+    
+    return classifier.frame_detections, classifier._collect_detection_array()
@@ -3,6 +3,8 @@ Visualization Module
 Create plots and visualizations for traffic analysis
 """
 
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend; plots are only saved to files
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -16,6 +18,9 @@ class TrafficVisualizer:
     Generate visualizations for traffic analysis results
     """
     
+    # Heatmaps with more time bins than this sum neighbouring bins together
+    HEATMAP_MAX_BINS = 200
+    
     def __init__(self, style: str = 'seaborn-v0_8-darkgrid'):
         """
         Initialize visualizer
@@ -30,6 +35,21 @@ class TrafficVisualizer:
         
         sns.set_palette("husl")
         self.colors = sns.color_palette("husl", 13)
+        
+        # One figure reused by every plot instead of creating one per call.
+        # Constrained layout is set once and replaces per-save tight bboxes
+        self._fig = plt.figure(figsize=(12, 6), layout='constrained')
+        self.dpi = 150
+    
+    def close(self):
+        """Release the shared figure"""
+        plt.close(self._fig)
+    
+    def _figure(self, figsize: tuple) -> plt.Figure:
+        """Clear and resize the shared figure for the next plot"""
+        self._fig.clear()
+        self._fig.set_size_inches(*figsize)
+        return self._fig
     
     def plot_density_timeline(self, ts_df: pd.DataFrame, output_path: str):
         """
@@ -39,7 +59,8 @@ class TrafficVisualizer:
             ts_df: Time-series DataFrame
             output_path: Path to save plot
         """
-        fig, axes = plt.subplots(3, 1, figsize=(14, 10))
+        fig = self._figure((14, 10))
+        axes = fig.subplots(3, 1)
         
         # Plot 1: Vehicle count over time
         axes[0].plot(ts_df['bin_id'], ts_df['total_vehicle_count'], 
@@ -81,9 +102,7 @@ class TrafficVisualizer:
         axes[2].legend(loc='best')
         axes[2].grid(True, alpha=0.3)
         
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.savefig(output_path, dpi=self.dpi)
         print(f"✓ Density timeline saved to: {output_path}")
     
     def plot_vehicle_distribution(self, ts_df: pd.DataFrame, output_path: str):
@@ -119,7 +138,8 @@ class TrafficVisualizer:
             print("⚠ No vehicles detected for distribution plot")
             return
         
-        fig, axes = plt.subplots(1, 2, figsize=(16, 6))
+        fig = self._figure((16, 6))
+        axes = fig.subplots(1, 2)
         
         # Bar chart
         vehicles = list(vehicle_totals.keys())
@@ -144,9 +164,7 @@ class TrafficVisualizer:
                    textprops={'fontsize': 10, 'fontweight': 'bold'})
         axes[1].set_title('Vehicle Type Proportion', fontsize=14, fontweight='bold')
         
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.savefig(output_path, dpi=self.dpi)
         print(f"✓ Vehicle distribution saved to: {output_path}")
     
     def plot_heatmap(self, ts_df: pd.DataFrame, output_path: str):
@@ -165,9 +183,17 @@ class TrafficVisualizer:
             print("⚠ No vehicle type data found for heatmap")
             return
         
-        # Create matrix: rows = time bins, columns = vehicle types
-        heatmap_data = ts_df[vehicle_cols].T
-        heatmap_data.columns = ts_df['bin_id'].values
+        # Long videos: sum every k consecutive bins, labelled by the first
+        counts = ts_df[vehicle_cols]
+        bin_ids = ts_df['bin_id'].values
+        k = -(-len(ts_df) // self.HEATMAP_MAX_BINS)
+        if k > 1:
+            counts = counts.groupby(np.arange(len(ts_df)) // k).sum()
+            bin_ids = bin_ids[::k]
+        
+        # Create matrix: rows = vehicle types, columns = time bins
+        heatmap_data = counts.T
+        heatmap_data.columns = bin_ids
         heatmap_data.index = [col.replace('_count', '') for col in vehicle_cols]
         
         # Filter out all-zero rows
@@ -177,20 +203,21 @@ class TrafficVisualizer:
             print("⚠ No data for heatmap")
             return
         
-        fig, ax = plt.subplots(figsize=(16, 8))
+        fig = self._figure((16, 8))
+        ax = fig.subplots()
         
+        # About 20 tick labels however many bins there are
         sns.heatmap(heatmap_data, cmap='YlOrRd', annot=False, 
                    fmt='d', linewidths=0.5, cbar_kws={'label': 'Vehicle Count'},
-                   ax=ax)
+                   xticklabels=max(1, heatmap_data.shape[1] // 20), yticklabels=True,
+                   rasterized=True, ax=ax)
         
-        ax.set_xlabel('Time Bin', fontsize=12)
+        ax.set_xlabel(f'Time Bin ({k} bins per column)' if k > 1 else 'Time Bin', fontsize=12)
         ax.set_ylabel('Vehicle Type', fontsize=12)
         ax.set_title('Vehicle Type Distribution Across Time Bins', 
                     fontsize=14, fontweight='bold')
         
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.savefig(output_path, dpi=self.dpi)
         print(f"✓ Heatmap saved to: {output_path}")
     
     def create_summary_dashboard(self, ts_df: pd.DataFrame, 
@@ -204,12 +231,12 @@ class TrafficVisualizer:
             summary_stats: Summary statistics dictionary
             output_path: Path to save dashboard
         """
-        fig = plt.figure(figsize=(18, 10))
-        gs = fig.add_gridspec(3, 3, hspace=0.3, wspace=0.3)
+        fig = self._figure((18, 10))
+        gs = fig.add_gridspec(3, 3)
         
-        # Title
+        # Title (placed and spaced by the constrained layout)
         fig.suptitle('Traffic Analysis Dashboard', 
-                    fontsize=18, fontweight='bold', y=0.98)
+                    fontsize=18, fontweight='bold')
         
         # 1. Traffic volume timeline
         ax1 = fig.add_subplot(gs[0, :])
@@ -278,6 +305,5 @@ class TrafficVisualizer:
             ax5.set_xlabel('Count')
             ax5.grid(axis='x', alpha=0.3)
         
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.savefig(output_path, dpi=self.dpi)
         print(f"✓ Summary dashboard saved to: {output_path}")